@@ -1,685 +1,932 @@
-import os
-import sys
-import json
-import aiomysql
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command, CommandStart
-from threading import Thread
-from contextlib import asynccontextmanager
-from aiogram.types import (
-    Message,
-    CallbackQuery,
-    ReplyKeyboardMarkup,
-    KeyboardButton,
-    ReplyKeyboardRemove,
-    InlineKeyboardMarkup,
-    InlineKeyboardButton
-)
-from aiogram.utils.keyboard import InlineKeyboardBuilder
-from datetime import datetime, timedelta
-import secrets
-import asyncio
-import aiohttp
-import logging
-import tempfile
-import pdfplumber
-import io
-import re
-from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.memory import MemoryStorage
-from dotenv import load_dotenv
-
-# Загрузка переменных окружения
-load_dotenv()
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
-logger = logging.getLogger(__name__)
-
-# --- Конфигурация из .env ---
-API_TOKEN = os.getenv('API_TOKEN')
-ADMIN_IDS = list(map(int, os.getenv('ADMIN_IDS').split(',')))
-ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
-SUSPICIOUS_RECEIPT_LIMIT = int(os.getenv('SUSPICIOUS_RECEIPT_LIMIT', 3))
-MAX_PDF_SIZE = int(os.getenv('MAX_PDF_SIZE', 3 * 1024 * 1024))  # 3MB по умолчанию
-RECEIPT_MAX_AGE_MINUTES = int(os.getenv('RECEIPT_MAX_AGE_MINUTES', 25))
-
-# Настройки оплаты
-PAYMENT_DETAILS = {
-    "card_number": os.getenv('CARD_NUMBER'),
-    "card_name": os.getenv('CARD_NAME'),
-    "recipient_name": os.getenv('RECIPIENT_NAME'),
-    "tariff_prices": {
-        "2 минуты": 0,
-        "1 час": 490,
-        "2 часа": 790
-    }
-}
-
-TARIFFS = {
-    "2 минуты": 2,
-    "1 час": 60,
-    "2 часа": 120
-}
-
-# Database Configuration
-MYSQL_CONFIG = {
-    'host': os.getenv('DB_HOST'),
-    'user': os.getenv('DB_USER'),
-    'password': os.getenv('DB_PASSWORD'),
-    'database': os.getenv('DB_NAME'),
-    'pool_name': 'bot_pool',
-    'pool_size': 5,
-    'connect_timeout': 5
-}
-
-# Глобальные переменные
-pool = None  # Пул подключений к БД
-
-# Инициализация бота
-bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
-
-# Кэш и состояния
-user_cache = {}
-user_tariffs = {}
-extend_sessions = {}
-menu_hint_shown = set()
-
-# --- Классы состояний ---
-class AdminStates(StatesGroup):
-    waiting_password = State()
-    main_menu = State()
-    change_card = State()
-    change_name = State()
-    change_tariff = State()
-    block_user = State()
-    unblock_user = State()
-    view_stats = State()
-
-# --- Вспомогательные функции ---
-async def init_db():
-    """Инициализирует пул подключений к базе данных"""
-    global pool
-    try:
-        pool = await aiomysql.create_pool(
-            host=os.getenv('DB_HOST'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            db=os.getenv('DB_NAME'),
-            autocommit=True,
-            pool_recycle=3600,
-            maxsize=10,
-            charset='utf8mb4'
-        )
-        return pool
-    except Exception as e:
-        logger.error(f"Ошибка создания пула БД: {e}")
-        return None
-
-@asynccontextmanager
-async def get_db():
-    """Асинхронный контекстный менеджер для работы с БД"""
-    if pool is None:
-        await init_db()
-    async with pool.acquire() as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cur:
-            yield cur
-
-async def execute_db(query: str, params=None, fetch_one=False, fetch_all=False, commit=False):
-    """Выполняет SQL запрос с обработкой ошибок"""
-    try:
-        async with get_db() as cur:
-            await cur.execute(query, params or ())
-            if fetch_one:
-                return await cur.fetchone()
-            elif fetch_all:
-                return await cur.fetchall()
-            elif commit:
-                return True
-            return True
-    except Exception as e:
-        logger.error(f"Ошибка выполнения запроса: {e}")
-        return None
-
-async def notify_website(user_id: int, session_id: str):
-    """Уведомляет сайт об обновлении сессии"""
-    try:
-        # Получаем базовый URL из переменной окружения Replit или используем localhost
-        base_url = os.getenv('REPLIT_APP_URL', 'http://localhost:5000')
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{base_url}/api/session_updated",
-                json={'user_id': user_id, 'session_id': session_id},
-                timeout=2
-            ):
-                pass
-    except Exception as e:
-        logger.error(f"Ошибка уведомления сайта: {e}")
-
-# --- Функции для работы с чеками ---
-def extract_text_from_pdf_sync(file_bytes: bytes) -> str:
-    """Синхронная версия извлечения текста из PDF"""
-    try:
-        with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-            text_parts = []
-            for page in pdf.pages:
-                if text := page.extract_text():
-                    text_parts.append(text)
-            return "\n".join(text_parts)
-    except Exception as e:
-        logger.error(f"Ошибка извлечения текста из PDF: {e}")
-        return ""
-
-async def extract_text_from_pdf(file_bytes: bytes) -> str:
-    """Асинхронная обертка для извлечения текста"""
-    return await asyncio.to_thread(extract_text_from_pdf_sync, file_bytes)
-
-async def validate_receipt(filename: str, text: str, tariff: str) -> tuple[bool, str]:
-    """Проверяет чек на соответствие требованиям и возвращает (результат, причина)"""
-    # 1. Проверка суммы
-    price = PAYMENT_DETAILS["tariff_prices"][tariff]
-    if price > 0:
-        # Ищем сумму в тексте чека (учитываем разные форматы)
-        price_str = str(price)
-        if not any(pattern in text for pattern in [
-            f"{price_str},00", f"{price_str}.00",
-            f"{price_str} KZT", f"{price_str}₸",
-            f"{price_str} тг", f"{price_str} тенге"
-        ]):
-            return False, f"❌ Сумма в чеке не соответствует тарифу ({price}₸)"
-
-    # 2. Проверка получателя
-    if PAYMENT_DETAILS["recipient_name"] not in text:
-        return False, "❌ Получатель в чеке не соответствует указанному"
-
-    # 3. Проверка времени
-    receipt_time = None
-    for pattern, dt_format in [
-        (r"(\d{2})\.(\d{2})\.(\d{4})\s(\d{2}):(\d{2})", "%d.%m.%Y %H:%M"),
-        (r"(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2})", "%Y-%m-%dT%H:%M")
-    ]:
-        if match := re.search(pattern, text):
-            try:
-                receipt_time = datetime.strptime(match.group(), dt_format)
-                break
-            except ValueError:
-                continue
-
-    if not receipt_time:
-        return False, "❌ Не удалось определить время в чеке"
-
-    if (datetime.now() - receipt_time) > timedelta(minutes=RECEIPT_MAX_AGE_MINUTES):
-        return False, f"❌ Чек слишком старый (более {RECEIPT_MAX_AGE_MINUTES} минут)"
-
-    # 4. Проверка номера транзакции
-    # Ищем номер транзакции из имени файла в тексте чека
-    transaction_numbers = re.findall(r'\d+', filename)
-    if not transaction_numbers:
-        return False, "❌ Не удалось найти номер транзакции в чеке"
-
-    # Берем самое длинное число из имени файла как номер транзакции
-    transaction_id = max(transaction_numbers, key=len)
-
-    # Проверяем, что этот номер есть в тексте чека
-    if transaction_id not in text:
-        return False, "❌ Номер транзакции из имени файла не найден в чеке"
-
-    if await execute_db("SELECT 1 FROM receipt_transactions WHERE receipt_id = %s", (transaction_id,), fetch_one=True):
-        return False, "❌ Этот чек уже был использован"
-
-    return True, "✅ Чек успешно прошел проверку"
-
-async def log_suspicious_receipt(user_id: int, username: str, file_name: str) -> int:
-    """Логирует подозрительный чек"""
-    await execute_db(
-        "INSERT INTO suspicious_receipts (user_id, username, file_name) "
-        "VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE receipt_count = receipt_count + 1",
-        (user_id, username, file_name),
-        commit=True
-    )
-    result = await execute_db(
-        "SELECT receipt_count FROM suspicious_receipts WHERE user_id = %s AND file_name = %s",
-        (user_id, file_name),
-        fetch_one=True
-    )
-    return result['receipt_count'] if result else 1
-
-async def log_transaction(transaction_id: str, user_id: int):
-    """Логирует успешную транзакцию"""
-    await execute_db(
-        "INSERT INTO receipt_transactions (receipt_id, user_id) "
-        "VALUES (%s, %s) ON DUPLICATE KEY UPDATE used_at = NOW()",
-        (transaction_id, user_id),
-        commit=True
-    )
-
-async def is_user_blocked(user_id: int) -> bool:
-    """Проверяет заблокирован ли пользователь"""
-    result = await execute_db(
-        "SELECT 1 FROM suspicious_receipts WHERE user_id = %s AND is_blocked = TRUE LIMIT 1",
-        (user_id,),
-        fetch_one=True
-    )
-    return result is not None
-
-async def is_new_user(user_id: int) -> bool:
-    """Проверяет новый ли пользователь"""
-    result = await execute_db(
-        "SELECT 1 FROM codes WHERE user_id = %s LIMIT 1",
-        (user_id,),
-        fetch_one=True
-    )
-    return result is None
-
-# --- Логирование действий ---
-async def log_admin_action(user_id: int, action: str):
-    """Логирует действие администратора"""
-    await execute_db(
-        "INSERT INTO admin_logs (admin_id, action) VALUES (%s, %s)",
-        (user_id, action),
-        commit=True
-    )
-
-async def log_user_activity(user_id: int, action: str):
-    """Логирует действия пользователей"""
-    await execute_db(
-        "INSERT INTO user_activity (user_id, action) VALUES (%s, %s)",
-        (user_id, action),
-        commit=True
-    )
-
-async def update_user_stats(user_id: int):
-    """Обновляет статистику пользователя"""
-    await execute_db(
-        "INSERT INTO user_stats (user_id, first_seen, last_seen) "
-        "VALUES (%s, NOW(), NOW()) ON DUPLICATE KEY UPDATE last_seen = NOW()",
-        (user_id,),
-        commit=True
-    )
-
-async def log_payment(user_id: int, amount: int, tariff: str):
-    """Логирует платеж"""
-    await execute_db(
-        "INSERT INTO payments (user_id, amount, tariff) VALUES (%s, %s, %s)",
-        (user_id, amount, tariff),
-        commit=True
-    )
-
-# --- Клавиатуры ---
-def get_main_keyboard():
-    """Основная клавиатура с меню и сессиями"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="💎 Выбрать тариф")],
-            [KeyboardButton(text="🕒 Мои сессии")],
-            [KeyboardButton(text="📋 Меню")]
-        ],
-        resize_keyboard=True
-    )
-
-async def get_tariff_keyboard(user_id: int):
-    """Клавиатура с тарифами"""
-    builder = InlineKeyboardBuilder()
-
-    if await is_new_user(user_id):
-        builder.button(text="2 минуты (бесплатно)", callback_data="tariff_2 минуты")
-
-    builder.button(text="1 час - 490₸", callback_data="tariff_1 час")
-    builder.button(text="2 часа - 790₸", callback_data="tariff_2 часа")
-
-    builder.adjust(1)
-    return builder.as_markup()
-
-# --- Основные обработчики ---
-@dp.message(CommandStart())
-async def cmd_start(message: Message):
-    """Обработчик команды /start"""
-    user_id = message.from_user.id
-    if await is_user_blocked(user_id):
-        await message.answer("⛔ Ваш доступ к боту заблокирован")
-        return
-
-    await update_user_stats(user_id)
-    await log_user_activity(user_id, "start")
-
-    welcome_text = """
-🔥 Добро пожаловать в наш бот!
-
-[Здесь будет ваше описание товара/услуги]
-- Пункт 1
-- Пункт 2
-- Пункт 3
-
-Нажмите кнопку ниже, чтобы выбрать тариф.
-"""
-
-    await message.answer(welcome_text, reply_markup=get_main_keyboard())
-
-@dp.message(F.text == "💎 Выбрать тариф")
-async def show_tariffs(message: Message):
-    """Показывает доступные тарифы"""
-    keyboard = await get_tariff_keyboard(message.from_user.id)
-    await message.answer("Выберите подходящий тариф:", reply_markup=keyboard)
-
-@dp.message(F.text == "📋 Меню")
-async def handle_menu_button(message: Message):
-    """Обработчик кнопки меню"""
-    await show_main_menu(message)
-
-async def show_main_menu(message: Message):
-    """Показывает главное меню"""
-    user_id = message.from_user.id
-    if user_id in ADMIN_IDS:
-        await show_admin_menu(message)
-    else:
-        keyboard = await get_tariff_keyboard(user_id)
-        await message.answer("Выберите тариф для доступа:", reply_markup=keyboard)
-
-@dp.callback_query(F.data.startswith("tariff_"))
-async def process_tariff(callback: CallbackQuery):
-    """Обработчик выбора тарифа"""
-    await callback.answer()
-    tariff = callback.data.replace('tariff_', '')
-    user_tariffs[callback.from_user.id] = tariff
-
-    if tariff == "2 минуты":
-        code, session_id = await generate_code(callback.from_user.id, tariff)
-        await callback.message.edit_text(
-            f"✅ Ваш бесплатный код доступа: <code>{code}</code>\n"
-            f"Тариф: {tariff}\n"
-            f"Срок действия: {TARIFFS[tariff]} минут",
-            parse_mode="HTML"
-        )
-        await notify_website(callback.from_user.id, session_id)
-        return
-
-    payment_text = (
-        f"Тариф: {tariff}\n"
-        f"Сумма к оплате: {PAYMENT_DETAILS['tariff_prices'][tariff]}₸\n\n"
-        f"Реквизиты для оплаты:\n"
-        f"Карта: {PAYMENT_DETAILS['card_number']}\n"
-        f"Получатель: {PAYMENT_DETAILS['card_name']}\n\n"
-        "После оплаты отправьте чек (PDF) и нажмите /checkpayment"
-    )
-
-    await callback.message.edit_text(payment_text, reply_markup=None)
-
-@dp.message(F.document)
-async def handle_payment_proof(message: Message):
-    """Обработчик чеков"""
-    user_id = message.from_user.id
-    username = message.from_user.username or "нет_username"
-
-    if await is_user_blocked(user_id):
-        await message.answer("⛔ Ваш доступ к боту заблокирован")
-        return
-
-    if user_id not in user_tariffs:
-        await message.answer("❌ Сначала выберите тариф через меню", reply_markup=get_main_keyboard())
-        return
-
-    try:
-        if message.document.mime_type != "application/pdf":
-            await message.answer("❌ Отправьте чек в формате PDF", reply_markup=get_main_keyboard())
-            return
-
-        if message.document.file_size > MAX_PDF_SIZE:
-            await message.answer(f"❌ Файл слишком большой. Максимум: {MAX_PDF_SIZE//1024//1024}MB")
-            return
-
-        processing_msg = await message.answer("⏳ Обрабатываю чек...")
-
-        file = await bot.get_file(message.document.file_id)
-        file_bytes = await bot.download_file(file.file_path)
-        text = await extract_text_from_pdf(file_bytes.read())
-
-        is_valid, reason = await validate_receipt(message.document.file_name, text, user_tariffs[user_id])
-        if is_valid:
-            # Извлекаем самое длинное число из имени файла как номер транзакции
-            transaction_id = max(re.findall(r'\d+', message.document.file_name), key=len)
-            await log_transaction(transaction_id, user_id)
-            await message.answer("✅ Чек принят! Нажмите /checkpayment для кода")
-        else:
-            count = await log_suspicious_receipt(user_id, username, message.document.file_name)
-            if count >= SUSPICIOUS_RECEIPT_LIMIT:
-                await message.answer("⛔ Вы заблокированы за подозрительные чеки")
-            else:
-                error_text = f"{reason}\n\nПожалуйста, убедитесь что:\n"
-                error_text += "1. Чек в формате PDF\n"
-                error_text += f"2. Сумма соответствует выбранному тарифу ({PAYMENT_DETAILS['tariff_prices'][user_tariffs[user_id]]}₸)\n"
-                error_text += f"3. Получатель: {PAYMENT_DETAILS['recipient_name']}\n"
-                error_text += f"4. Чек не старше {RECEIPT_MAX_AGE_MINUTES} минут"
-                await message.answer(error_text, reply_markup=get_main_keyboard())
-
-        await bot.delete_message(chat_id=message.chat.id, message_id=processing_msg.message_id)
-
-    except Exception as e:
-        logger.error(f"Ошибка обработки чека: {e}")
-        await message.answer("⚠️ Ошибка обработки чека. Попробуйте снова")
-
-@dp.message(Command("checkpayment"))
-async def cmd_check_payment(message: Message):
-    """Обработчик проверки платежа"""
-    user_id = message.from_user.id
-    if user_id not in user_tariffs:
-        await message.answer("❌ Сначала выберите тариф через меню", reply_markup=get_main_keyboard())
-        return
-
-    tariff = user_tariffs[user_id]
-
-    # Для бесплатного тарифа сразу выдаем код
-    if tariff == "2 минуты":
-        code, session_id = await generate_code(user_id, tariff)
-        await send_code_message(message, code, tariff)
-        return
-
-    # Для платных тарифов проверяем наличие подтвержденного чека
-    has_valid_receipt = await execute_db(
-        "SELECT 1 FROM receipt_transactions WHERE user_id = %s AND used_at > DATE_SUB(NOW(), INTERVAL 1 HOUR)",
-        (user_id,),
-        fetch_one=True
-    )
-
-    if not has_valid_receipt:
-        await message.answer("❌ Чек не найден или просрочен. Отправьте PDF-чек.")
-        return
-
-    code, session_id = await generate_code(user_id, tariff)
-    amount = PAYMENT_DETAILS["tariff_prices"][tariff]
-
-    if amount > 0:
-        await log_payment(user_id, amount, tariff)
-
-    await message.answer(
-        f"✅ Ваш код доступа: <code>{code}</code>\n"
-        f"Тариф: {tariff}\n"
-        f"Срок действия: {TARIFFS[tariff]} минут",
-        parse_mode="HTML",
-        reply_markup=get_main_keyboard()
-    )
-
-    user_tariffs.pop(user_id, None)
-    await notify_website(user_id, session_id)
-
-async def send_code_message(message: Message, code: str, tariff: str):
-    """Отправляет сообщение с кодом доступа"""
-    await message.answer(
-        f"✅ Ваш код доступа: <code>{code}</code>\n"
-        f"Тариф: {tariff}\n"
-        f"Срок действия: {TARIFFS[tariff]} минут",
-        parse_mode="HTML",
-        reply_markup=get_main_keyboard()
-    )
-
-@dp.message(F.text == "🕒 Мои сессии")
-async def handle_my_sessions(message: Message):
-    """Обработчик кнопки моих сессий"""
-    user_id = message.from_user.id
-    sessions = await execute_db(
-        """SELECT 
-            code, 
-            CASE 
-                WHEN expires_at > NOW() THEN 'active'
-                ELSE 'expired'
-            END as status,
-            expires_at,
-            duration_minutes
-        FROM codes 
-        WHERE user_id = %s 
-        ORDER BY expires_at DESC""",
-        (user_id,),
-        fetch_all=True
-    )
-
-    if not sessions:
-        await message.answer("У вас ещё нет сессий.", reply_markup=get_main_keyboard())
-        return
-
-    response = ["Ваши сессии:\n"]
-    for session in sessions:
-        emoji = "🟢" if session['status'] == 'active' else "🔴"
-        response.append(
-            f"{emoji} {session['duration_minutes']} мин. "
-            f"(до {session['expires_at'].strftime('%d.%m.%Y %H:%M')})"
-            f"{' - код: ' + session['code'] if session['status'] == 'active' else ''}"
-        )
-
-    await message.answer("\n".join(response), reply_markup=get_main_keyboard())
-
-@dp.message(Command("myid"))
-async def cmd_myid(message: Message):
-    """Показывает ID пользователя"""
-    await message.answer(f"Ваш chat_id: {message.from_user.id}", reply_markup=get_main_keyboard())
-
-# --- Админ-панель ---
-@dp.message(Command("admin"))
-async def cmd_admin(message: Message, state: FSMContext):
-    """Вход в админ-панель"""
-    if message.from_user.id not in ADMIN_IDS:
-        await message.answer("⛔ У вас нет прав администратора")
-        return
-
-    await log_admin_action(message.from_user.id, "Вход в админ-панель")
-    await show_admin_menu(message)
-
-async def show_admin_menu(message: Message):
-    """Меню администратора"""
-    markup = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📊 Статистика")],
-            [KeyboardButton(text="👥 Пользователи")],
-            [KeyboardButton(text="🔒 Блокировки")],
-            [KeyboardButton(text="💳 Реквизиты")],
-            [KeyboardButton(text="📋 Главное меню")]
-        ],
-        resize_keyboard=True
-    )
-
-    await message.answer("👨‍💻 Панель администратора\nВыберите раздел:", reply_markup=markup)
-
-@dp.message(F.text == "📊 Статистика")
-async def admin_stats(message: Message):
-    """Статистика бота"""
-    if message.from_user.id not in ADMIN_IDS:
-        return
-
-    try:
-        stats = await execute_db(
-            "SELECT COUNT(*) as total_users, "
-            "SUM(CASE WHEN DATE(first_seen) = CURDATE() THEN 1 ELSE 0 END) as today_users "
-            "FROM user_stats",
-            fetch_one=True
-        )
-
-        payments = await execute_db(
-            "SELECT COUNT(*) as count, SUM(amount) as total FROM payments WHERE DATE(payment_date) = CURDATE()",
-            fetch_one=True
-        )
-
-        response = (
-            "📊 Статистика:\n"
-            f"👥 Всего пользователей: {stats['total_users']}\n"
-            f"🆕 Новых сегодня: {stats['today_users']}\n"
-            f"💳 Платежей сегодня: {payments['count']} на {payments['total'] or 0}₸"
-        )
-
-        await message.answer(response)
-
-    except Exception as e:
-        logger.error(f"Ошибка получения статистики: {e}")
-        await message.answer("⚠️ Ошибка получения статистики")
-
-@dp.message(F.text == "📋 Главное меню")
-async def admin_back_to_main(message: Message):
-    """Возврат из админ-панели в главное меню"""
-    await show_main_menu(message)
-
-@dp.message(F.text == "👥 Пользователи")
-async def admin_users(message: Message):
-    if message.from_user.id not in ADMIN_IDS:
-        return
-    stats = await execute_db("SELECT COUNT(*) as total FROM user_stats", fetch_one=True)
-    await message.answer(f"Всего пользователей: {stats['total'] if stats else 0}")
-
-@dp.message(F.text == "🔒 Блокировки")
-async def admin_blocks(message: Message):
-    if message.from_user.id not in ADMIN_IDS:
-        return
-    blocked = await execute_db("SELECT COUNT(DISTINCT user_id) as blocked FROM suspicious_receipts WHERE is_blocked = TRUE", fetch_one=True)
-    await message.answer(f"Заблокировано пользователей: {blocked['blocked'] if blocked else 0}")
-
-@dp.message(F.text == "💳 Реквизиты")
-async def admin_card_info(message: Message):
-    if message.from_user.id not in ADMIN_IDS:
-        return
-    await message.answer(
-        f"Текущие реквизиты:\n"
-        f"Карта: {PAYMENT_DETAILS['card_number']}\n"
-        f"Получатель: {PAYMENT_DETAILS['card_name']}\n"
-        f"Имя для проверки: {PAYMENT_DETAILS['recipient_name']}"
-    )
-
-# --- Функции генерации кодов ---
-async def generate_code(user_id: int, tariff: str) -> tuple[str, str]:
-    """Генерирует код доступа"""
-    session_id = secrets.token_hex(8)
-    code = secrets.token_hex(4)
-    duration = TARIFFS[tariff]
-
-    await execute_db(
-        "INSERT INTO codes (code, user_id, session_id, duration_minutes, expires_at) "
-        "VALUES (%s, %s, %s, %s, DATE_ADD(NOW(), INTERVAL %s MINUTE))",
-        (code, user_id, session_id, duration, duration),
-        commit=True
-    )
-
-    return code, session_id
-
-# --- Основные настройки ---
-
-# --- Запуск бота ---
-async def main():
-    """Основная функция запуска"""
-    logger.info("Бот запускается...")
-    
-    # Инициализируем пул подключений к БД
-    if await init_db() is None:
-        logger.error("Не удалось инициализировать подключение к БД")
-        return
-        
-    try:
-        await dp.start_polling(bot)
-    finally:
-        if pool:
-            pool.close()
-            await pool.wait_closed()
-
-if __name__ == '__main__':
+import os
+import orjson
+import aiomysql
+from aiogram import Bot, Dispatcher, F
+from aiogram.filters import Command, CommandStart
+from contextlib import asynccontextmanager
+from aiogram.types import (
+    Message,
+    CallbackQuery,
+    ReplyKeyboardMarkup,
+    KeyboardButton
+)
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from datetime import datetime, timedelta
+import time
+import asyncio
+import aiohttp
+import logging
+import concurrent.futures
+import io
+import re
+import zlib
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# --- Конфигурация из .env ---
+API_TOKEN = os.getenv('API_TOKEN')
+ADMIN_IDS = list(map(int, os.getenv('ADMIN_IDS').split(',')))
+ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
+SUSPICIOUS_RECEIPT_LIMIT = int(os.getenv('SUSPICIOUS_RECEIPT_LIMIT', 3))
+MAX_PDF_SIZE = int(os.getenv('MAX_PDF_SIZE', 3 * 1024 * 1024))  # 3MB по умолчанию
+RECEIPT_MAX_AGE_MINUTES = int(os.getenv('RECEIPT_MAX_AGE_MINUTES', 25))
+
+# Webhook-режим (если WEBHOOK_URL не задан — остаемся на long polling)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', 8080))
+
+# Настройки оплаты
+PAYMENT_DETAILS = {
+    "card_number": os.getenv('CARD_NUMBER'),
+    "card_name": os.getenv('CARD_NAME'),
+    "recipient_name": os.getenv('RECIPIENT_NAME'),
+    "tariff_prices": {
+        "2 минуты": 0,
+        "1 час": 490,
+        "2 часа": 790
+    }
+}
+
+TARIFFS = {
+    "2 минуты": 2,
+    "1 час": 60,
+    "2 часа": 120
+}
+
+# Глобальные переменные
+pool = None  # Пул подключений к БД
+HTTP_SESSION: aiohttp.ClientSession | None = None  # Переиспользуемая HTTP-сессия
+_BG_TASKS: set[asyncio.Task] = set()  # Держим ссылки на фоновые задачи от GC
+
+# Инициализация бота
+bot = Bot(token=API_TOKEN)
+
+# Хранилище FSM: с Redis несколько воркеров могут делить состояние,
+# без REDIS_URL остаемся в памяти (один процесс, как раньше)
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    storage = RedisStorage.from_url(REDIS_URL)
+    redis_client = storage.redis
+else:
+    storage = MemoryStorage()
+    redis_client = None
+dp = Dispatcher(storage=storage)
+
+# Кэш и состояния
+user_tariffs = {}  # Локальный fallback выбора тарифа, когда Redis не настроен
+TARIFF_TTL = 3600  # секунды: выбранный тариф не живет дольше часа
+
+async def set_user_tariff(user_id: int, tariff: str):
+    """Запоминает выбранный тариф пользователя"""
+    if redis_client:
+        await redis_client.set(f"tariff:{user_id}", tariff, ex=TARIFF_TTL)
+    else:
+        user_tariffs[user_id] = tariff
+
+async def get_user_tariff(user_id: int) -> str | None:
+    """Возвращает выбранный тариф или None"""
+    if redis_client:
+        value = await redis_client.get(f"tariff:{user_id}")
+        return value.decode() if isinstance(value, bytes) else value
+    return user_tariffs.get(user_id)
+
+async def clear_user_tariff(user_id: int):
+    """Сбрасывает выбранный тариф"""
+    if redis_client:
+        await redis_client.delete(f"tariff:{user_id}")
+    else:
+        user_tariffs.pop(user_id, None)
+
+# --- Классы состояний ---
+class AdminStates(StatesGroup):
+    waiting_password = State()
+    main_menu = State()
+    change_card = State()
+    change_name = State()
+    change_tariff = State()
+    block_user = State()
+    unblock_user = State()
+    view_stats = State()
+
+# --- Вспомогательные функции ---
+async def init_db():
+    """Инициализирует пул подключений к базе данных"""
+    global pool
+    try:
+        pool = await aiomysql.create_pool(
+            host=os.getenv('DB_HOST'),
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+            db=os.getenv('DB_NAME'),
+            autocommit=True,
+            pool_recycle=3600,
+            minsize=5,
+            maxsize=30,
+            charset='utf8mb4'
+        )
+
+        # Прогрев: форсируем handshake соединений до первого пользователя
+        warmup_conns = [await pool.acquire() for _ in range(pool.minsize)]
+        for conn in warmup_conns:
+            await conn.ping()
+            pool.release(conn)
+
+        return pool
+    except Exception as e:
+        logger.error(f"Ошибка создания пула БД: {e}")
+        return None
+
+@asynccontextmanager
+async def get_db():
+    """Асинхронный контекстный менеджер для работы с БД"""
+    if pool is None:
+        await init_db()
+    async with pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            yield cur
+
+async def execute_db(query: str, params=None, fetch_one=False, fetch_all=False):
+    """Выполняет читающий SQL запрос с обработкой ошибок"""
+    try:
+        async with get_db() as cur:
+            await cur.execute(query, params or ())
+            if fetch_one:
+                return await cur.fetchone()
+            elif fetch_all:
+                return await cur.fetchall()
+            return True
+    except Exception as e:
+        logger.error(f"Ошибка выполнения запроса: {e}")
+        return None
+
+async def execute_write(query: str, params=None) -> bool:
+    """Выполняет одиночную запись: без курсора-словаря и fetch-веток"""
+    try:
+        if pool is None:
+            await init_db()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params or ())
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка выполнения запроса: {e}")
+        return False
+
+async def notify_website(user_id: int, session_id: str):
+    """Уведомляет сайт об обновлении сессии"""
+    try:
+        # Получаем базовый URL из переменной окружения Replit или используем localhost
+        base_url = os.getenv('REPLIT_APP_URL', 'http://localhost:5000')
+
+        async with HTTP_SESSION.post(
+            f"{base_url}/api/session_updated",
+            data=orjson.dumps({'user_id': user_id, 'session_id': session_id}),
+            headers={'Content-Type': 'application/json'}
+        ):
+            pass
+    except Exception as e:
+        logger.error(f"Ошибка уведомления сайта: {e}")
+
+def notify_website_bg(user_id: int, session_id: str):
+    """Запускает уведомление сайта в фоне, не задерживая ответ пользователю"""
+    task = asyncio.create_task(notify_website(user_id, session_id))
+    _BG_TASKS.add(task)
+    task.add_done_callback(_BG_TASKS.discard)
+
+# --- Функции для работы с чеками ---
+_PDF_STREAM_RE = re.compile(rb'stream\r?\n(.*?)\r?\nendstream', re.DOTALL)
+_DT_PATTERNS = [
+    (re.compile(r"(\d{2})\.(\d{2})\.(\d{4})\s(\d{2}):(\d{2})"), "%d.%m.%Y %H:%M"),
+    (re.compile(r"(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2})"), "%Y-%m-%dT%H:%M")
+]
+_DIGITS_RE = re.compile(r'\d+')
+_AMOUNT_RE_CACHE: dict[int, re.Pattern] = {}
+
+def _amount_pattern(price: int) -> re.Pattern:
+    """Регулярка суммы тарифа: один проход по тексту вместо шести поисков подстрок"""
+    pattern = _AMOUNT_RE_CACHE.get(price)
+    if pattern is None:
+        pattern = re.compile(rf'{price}(?:[.,]00|₸| KZT| тг| тенге)')
+        _AMOUNT_RE_CACHE[price] = pattern
+    return pattern
+
+def decode_pdf_streams(file_bytes: bytes) -> str:
+    """Достает текст из сырых PDF-потоков (открытых или под zlib) без парсера"""
+    try:
+        text_parts = []
+        for raw in _PDF_STREAM_RE.findall(file_bytes):
+            try:
+                raw = zlib.decompress(raw)
+            except zlib.error:
+                pass
+            text_parts.append(raw.decode("utf-8", errors="ignore"))
+        return "\n".join(text_parts)
+    except Exception as e:
+        logger.error(f"Ошибка быстрого сканирования PDF: {e}")
+        return ""
+
+def fast_scan(text: str, price: int, recipient: str, transaction_id: str) -> bool:
+    """Быстрая проверка чека по тексту из сырых PDF-потоков.
+
+    Для born-digital чеков (Kaspi/Halyk) нужные строки лежат в content
+    stream в открытом виде или под zlib. Если все токены (сумма,
+    получатель, номер транзакции, дата) найдены — текст годится для
+    validate_receipt и полный парсер не нужен.
+    """
+    try:
+        if price > 0 and not _amount_pattern(price).search(text):
+            return False
+
+        if recipient not in text or transaction_id not in text:
+            return False
+
+        return any(pattern.search(text) for pattern, _ in _DT_PATTERNS)
+    except Exception as e:
+        logger.error(f"Ошибка быстрого сканирования PDF: {e}")
+        return False
+
+# Пул процессов для парсинга PDF: даже C-backed парсер делает заметную
+# pure-Python работу под GIL, выносим её из процесса бота
+_PDF_POOL: concurrent.futures.ProcessPoolExecutor | None = None
+
+MAX_PDF_PAGES = 3  # Чеки занимают 1-2 страницы, остальное не читаем
+
+def extract_text_from_pdf_sync(file_bytes: bytes, required_tokens: tuple[str, ...] = ()) -> str:
+    """Синхронная версия извлечения текста из PDF.
+
+    Читает не более MAX_PDF_PAGES страниц и прекращает извлечение, как
+    только все required_tokens встретились в уже собранном тексте —
+    многостраничный мусор не парсится до конца.
+    """
+    # Импорт внутри функции: она исполняется и в воркер-процессах пула
+    import pymupdf
+    try:
+        doc = pymupdf.open(stream=file_bytes, filetype="pdf")
+        try:
+            text_parts = []
+            for page_number, page in enumerate(doc):
+                if page_number >= MAX_PDF_PAGES:
+                    break
+                if text := page.get_text("text"):
+                    text_parts.append(text)
+                if required_tokens:
+                    joined = "\n".join(text_parts)
+                    if all(token in joined for token in required_tokens):
+                        break
+            return "\n".join(text_parts)
+        finally:
+            doc.close()
+    except Exception as e:
+        logger.error(f"Ошибка извлечения текста из PDF: {e}")
+        return ""
+
+async def extract_text_from_pdf(file_bytes: bytes, required_tokens: tuple[str, ...] = ()) -> str:
+    """Асинхронная обертка для извлечения текста"""
+    if _PDF_POOL is not None:
+        return await asyncio.get_running_loop().run_in_executor(
+            _PDF_POOL, extract_text_from_pdf_sync, file_bytes, required_tokens
+        )
+    return await asyncio.to_thread(extract_text_from_pdf_sync, file_bytes, required_tokens)
+
+async def validate_receipt(transaction_id: str | None, text: str, tariff: str) -> tuple[bool, str]:
+    """Проверяет чек на соответствие требованиям и возвращает (результат, причина)"""
+    # 1. Проверка суммы
+    price = PAYMENT_DETAILS["tariff_prices"][tariff]
+    if price > 0:
+        # Ищем сумму в тексте чека (учитываем разные форматы)
+        if not _amount_pattern(price).search(text):
+            return False, f"❌ Сумма в чеке не соответствует тарифу ({price}₸)"
+
+    # 2. Проверка получателя
+    if PAYMENT_DETAILS["recipient_name"] not in text:
+        return False, "❌ Получатель в чеке не соответствует указанному"
+
+    # 3. Проверка времени
+    receipt_time = None
+    for pattern, dt_format in _DT_PATTERNS:
+        if match := pattern.search(text):
+            try:
+                receipt_time = datetime.strptime(match.group(), dt_format)
+                break
+            except ValueError:
+                continue
+
+    if not receipt_time:
+        return False, "❌ Не удалось определить время в чеке"
+
+    if (datetime.now() - receipt_time) > timedelta(minutes=RECEIPT_MAX_AGE_MINUTES):
+        return False, f"❌ Чек слишком старый (более {RECEIPT_MAX_AGE_MINUTES} минут)"
+
+    # 4. Проверка номера транзакции (извлечен из имени файла в обработчике)
+    if not transaction_id:
+        return False, "❌ Не удалось найти номер транзакции в чеке"
+
+    # Проверяем, что этот номер есть в тексте чека
+    if transaction_id not in text:
+        return False, "❌ Номер транзакции из имени файла не найден в чеке"
+
+    if await execute_db("SELECT 1 FROM receipt_transactions WHERE receipt_id = %s", (transaction_id,), fetch_one=True):
+        return False, "❌ Этот чек уже был использован"
+
+    return True, "✅ Чек успешно прошел проверку"
+
+async def log_suspicious_receipt(user_id: int, username: str, file_name: str) -> int:
+    """Логирует подозрительный чек и возвращает счётчик одним запросом"""
+    try:
+        if pool is None:
+            await init_db()
+        async with pool.acquire() as conn, conn.cursor() as cur:
+            # LAST_INSERT_ID(expr) отдает новый счетчик без отдельного SELECT
+            await cur.execute(
+                "INSERT INTO suspicious_receipts (user_id, username, file_name, receipt_count) "
+                "VALUES (%s, %s, %s, 1) "
+                "ON DUPLICATE KEY UPDATE receipt_count = LAST_INSERT_ID(receipt_count + 1)",
+                (user_id, username, file_name)
+            )
+            # rowcount == 1 — вставлена новая строка, счетчик равен 1;
+            # rowcount == 2 — обновление, счетчик лежит в LAST_INSERT_ID
+            count = cur.lastrowid if cur.rowcount == 2 else 1
+            if count >= SUSPICIOUS_RECEIPT_LIMIT:
+                # Пользователь мог быть заблокирован — сбрасываем кэш статуса
+                _blocked_cache.pop(user_id, None)
+            return count
+    except Exception as e:
+        logger.error(f"Ошибка логирования подозрительного чека: {e}")
+        return 1
+
+async def log_transaction(transaction_id: str, user_id: int):
+    """Логирует успешную транзакцию"""
+    await execute_write(
+        "INSERT INTO receipt_transactions (receipt_id, user_id) "
+        "VALUES (%s, %s) ON DUPLICATE KEY UPDATE used_at = NOW()",
+        (transaction_id, user_id)
+    )
+
+# Статус блокировки и "новизна" пользователя почти не меняются в пределах
+# минут — кэшируем в процессе, чтобы не ходить в БД на каждом сообщении
+_STATUS_CACHE_TTL = 60  # секунды
+_blocked_cache: dict[int, tuple[bool, float]] = {}
+_new_user_cache: dict[int, tuple[bool, float]] = {}
+
+async def is_user_blocked(user_id: int) -> bool:
+    """Проверяет заблокирован ли пользователь"""
+    cached = _blocked_cache.get(user_id)
+    if cached and time.monotonic() - cached[1] < _STATUS_CACHE_TTL:
+        return cached[0]
+
+    result = await execute_db(
+        "SELECT 1 FROM suspicious_receipts WHERE user_id = %s AND is_blocked = TRUE LIMIT 1",
+        (user_id,),
+        fetch_one=True
+    )
+    blocked = result is not None
+    _blocked_cache[user_id] = (blocked, time.monotonic())
+    return blocked
+
+async def is_new_user(user_id: int) -> bool:
+    """Проверяет новый ли пользователь"""
+    cached = _new_user_cache.get(user_id)
+    if cached and time.monotonic() - cached[1] < _STATUS_CACHE_TTL:
+        return cached[0]
+
+    result = await execute_db(
+        "SELECT 1 FROM codes WHERE user_id = %s LIMIT 1",
+        (user_id,),
+        fetch_one=True
+    )
+    new = result is None
+    _new_user_cache[user_id] = (new, time.monotonic())
+    return new
+
+# --- Логирование действий ---
+# Логирующие INSERT-ы не пишутся в БД сразу: они копятся в очереди и
+# периодически сбрасываются одним executemany на таблицу
+_log_queue: asyncio.Queue[tuple[str, tuple]] = asyncio.Queue()
+_LOG_FLUSH_INTERVAL = 0.5  # секунды
+
+_LOG_SQL = {
+    "admin_logs": "INSERT INTO admin_logs (admin_id, action) VALUES (%s, %s)",
+    "user_activity": "INSERT INTO user_activity (user_id, action) VALUES (%s, %s)",
+    # Только плейсхолдеры в VALUES: иначе executemany не склеит строки
+    # в один multi-row INSERT и выполнит их по одной
+    "user_stats": (
+        "INSERT INTO user_stats (user_id, first_seen, last_seen) "
+        "VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE last_seen = VALUES(last_seen)"
+    ),
+    "payments": "INSERT INTO payments (user_id, amount, tariff) VALUES (%s, %s, %s)"
+}
+
+async def _flush_log_queue():
+    """Сбрасывает накопленные логи в БД, группируя строки по таблицам"""
+    batches: dict[str, list[tuple]] = {}
+    while not _log_queue.empty():
+        table, row = _log_queue.get_nowait()
+        batches.setdefault(table, []).append(row)
+    if not batches:
+        return
+    try:
+        if pool is None:
+            await init_db()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                for table, rows in batches.items():
+                    await cur.executemany(_LOG_SQL[table], rows)
+    except Exception as e:
+        logger.error(f"Ошибка сброса логов в БД: {e}")
+
+async def _log_flusher():
+    """Фоновая задача периодического сброса очереди логов"""
+    while True:
+        await asyncio.sleep(_LOG_FLUSH_INTERVAL)
+        await _flush_log_queue()
+
+async def log_admin_action(user_id: int, action: str):
+    """Логирует действие администратора"""
+    await _log_queue.put(("admin_logs", (user_id, action)))
+
+async def log_user_activity(user_id: int, action: str):
+    """Логирует действия пользователей"""
+    await _log_queue.put(("user_activity", (user_id, action)))
+
+async def update_user_stats(user_id: int):
+    """Обновляет статистику пользователя"""
+    now = datetime.now()
+    await _log_queue.put(("user_stats", (user_id, now, now)))
+
+async def log_payment(user_id: int, amount: int, tariff: str):
+    """Логирует платеж"""
+    await _log_queue.put(("payments", (user_id, amount, tariff)))
+
+# --- Клавиатуры ---
+def get_main_keyboard():
+    """Основная клавиатура с меню и сессиями"""
+    return MAIN_KB
+
+# Клавиатура и тексты оплаты неизменны — собираем один раз при старте
+MAIN_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="💎 Выбрать тариф")],
+        [KeyboardButton(text="🕒 Мои сессии")],
+        [KeyboardButton(text="📋 Меню")]
+    ],
+    resize_keyboard=True
+)
+
+def build_payment_texts() -> dict[str, str]:
+    """Собирает тексты оплаты по тарифам (вызвать заново при смене реквизитов)"""
+    return {
+        tariff: (
+            f"Тариф: {tariff}\n"
+            f"Сумма к оплате: {price}₸\n\n"
+            f"Реквизиты для оплаты:\n"
+            f"Карта: {PAYMENT_DETAILS['card_number']}\n"
+            f"Получатель: {PAYMENT_DETAILS['card_name']}\n\n"
+            "После оплаты отправьте чек (PDF) и нажмите /checkpayment"
+        )
+        for tariff, price in PAYMENT_DETAILS["tariff_prices"].items()
+        if price > 0
+    }
+
+PAYMENT_TEXTS = build_payment_texts()
+
+async def get_tariff_keyboard(user_id: int):
+    """Клавиатура с тарифами"""
+    builder = InlineKeyboardBuilder()
+
+    if await is_new_user(user_id):
+        builder.button(text="2 минуты (бесплатно)", callback_data="tariff_2 минуты")
+
+    builder.button(text="1 час - 490₸", callback_data="tariff_1 час")
+    builder.button(text="2 часа - 790₸", callback_data="tariff_2 часа")
+
+    builder.adjust(1)
+    return builder.as_markup()
+
+# --- Основные обработчики ---
+@dp.message(CommandStart())
+async def cmd_start(message: Message):
+    """Обработчик команды /start"""
+    user_id = message.from_user.id
+    if await is_user_blocked(user_id):
+        await message.answer("⛔ Ваш доступ к боту заблокирован")
+        return
+
+    await asyncio.gather(
+        update_user_stats(user_id),
+        log_user_activity(user_id, "start")
+    )
+
+    welcome_text = """
+🔥 Добро пожаловать в наш бот!
+
+[Здесь будет ваше описание товара/услуги]
+- Пункт 1
+- Пункт 2
+- Пункт 3
+
+Нажмите кнопку ниже, чтобы выбрать тариф.
+"""
+
+    await message.answer(welcome_text, reply_markup=get_main_keyboard())
+
+@dp.message(F.text == "💎 Выбрать тариф")
+async def show_tariffs(message: Message):
+    """Показывает доступные тарифы"""
+    keyboard = await get_tariff_keyboard(message.from_user.id)
+    await message.answer("Выберите подходящий тариф:", reply_markup=keyboard)
+
+@dp.message(F.text == "📋 Меню")
+async def handle_menu_button(message: Message):
+    """Обработчик кнопки меню"""
+    await show_main_menu(message)
+
+async def show_main_menu(message: Message):
+    """Показывает главное меню"""
+    user_id = message.from_user.id
+    if user_id in ADMIN_IDS:
+        await show_admin_menu(message)
+    else:
+        keyboard = await get_tariff_keyboard(user_id)
+        await message.answer("Выберите тариф для доступа:", reply_markup=keyboard)
+
+@dp.callback_query(F.data.startswith("tariff_"))
+async def process_tariff(callback: CallbackQuery):
+    """Обработчик выбора тарифа"""
+    await callback.answer()
+    tariff = callback.data.replace('tariff_', '')
+    await set_user_tariff(callback.from_user.id, tariff)
+
+    if tariff == "2 минуты":
+        code, session_id = await generate_code(callback.from_user.id, tariff)
+        await callback.message.edit_text(
+            f"✅ Ваш бесплатный код доступа: <code>{code}</code>\n"
+            f"Тариф: {tariff}\n"
+            f"Срок действия: {TARIFFS[tariff]} минут",
+            parse_mode="HTML"
+        )
+        notify_website_bg(callback.from_user.id, session_id)
+        return
+
+    await callback.message.edit_text(PAYMENT_TEXTS[tariff], reply_markup=None)
+
+@dp.message(F.document)
+async def handle_payment_proof(message: Message):
+    """Обработчик чеков"""
+    user_id = message.from_user.id
+    username = message.from_user.username or "нет_username"
+
+    if await is_user_blocked(user_id):
+        await message.answer("⛔ Ваш доступ к боту заблокирован")
+        return
+
+    tariff = await get_user_tariff(user_id)
+    if tariff is None:
+        await message.answer("❌ Сначала выберите тариф через меню", reply_markup=get_main_keyboard())
+        return
+
+    try:
+        if message.document.mime_type != "application/pdf":
+            await message.answer("❌ Отправьте чек в формате PDF", reply_markup=get_main_keyboard())
+            return
+
+        if message.document.file_size > MAX_PDF_SIZE:
+            await message.answer(f"❌ Файл слишком большой. Максимум: {MAX_PDF_SIZE//1024//1024}MB")
+            return
+
+        processing_msg = await message.answer("⏳ Обрабатываю чек...")
+
+        file = await bot.get_file(message.document.file_id)
+        buffer = io.BytesIO()
+        await bot.download_file(file.file_path, destination=buffer)
+        raw_bytes = buffer.getvalue()
+
+        # Настоящий PDF начинается с сигнатуры %PDF- — мусор с поддельным
+        # mime-типом отсекаем до запуска парсера
+        if not raw_bytes.startswith(b"%PDF-"):
+            await message.answer("❌ Файл не является PDF-документом", reply_markup=get_main_keyboard())
+            await bot.delete_message(chat_id=message.chat.id, message_id=processing_msg.message_id)
+            return
+
+        # Извлекаем самое длинное число из имени файла как номер транзакции
+        transaction_numbers = _DIGITS_RE.findall(message.document.file_name)
+        transaction_id = max(transaction_numbers, key=len) if transaction_numbers else None
+
+        recipient = PAYMENT_DETAILS["recipient_name"]
+        price = PAYMENT_DETAILS["tariff_prices"][tariff]
+        stream_text = decode_pdf_streams(raw_bytes)
+
+        if recipient.encode() not in raw_bytes and recipient not in stream_text:
+            # Получателя нет ни в сырых байтах, ни в распакованных потоках —
+            # чек заведомо чужой, валидация ниже отклонит пустой текст
+            text = ""
+        elif transaction_id and fast_scan(stream_text, price, recipient, transaction_id):
+            # Все токены нашлись прямо в потоках — полный парсер не нужен
+            text = stream_text
+        else:
+            required_tokens = [recipient]
+            if price > 0:
+                required_tokens.append(str(price))
+            if transaction_id:
+                required_tokens.append(transaction_id)
+            text = await extract_text_from_pdf(raw_bytes, tuple(required_tokens))
+
+        is_valid, reason = await validate_receipt(transaction_id, text, tariff)
+        if is_valid:
+            await log_transaction(transaction_id, user_id)
+            await message.answer("✅ Чек принят! Нажмите /checkpayment для кода")
+        else:
+            count = await log_suspicious_receipt(user_id, username, message.document.file_name)
+            if count >= SUSPICIOUS_RECEIPT_LIMIT:
+                await message.answer("⛔ Вы заблокированы за подозрительные чеки")
+            else:
+                error_text = f"{reason}\n\nПожалуйста, убедитесь что:\n"
+                error_text += "1. Чек в формате PDF\n"
+                error_text += f"2. Сумма соответствует выбранному тарифу ({PAYMENT_DETAILS['tariff_prices'][tariff]}₸)\n"
+                error_text += f"3. Получатель: {PAYMENT_DETAILS['recipient_name']}\n"
+                error_text += f"4. Чек не старше {RECEIPT_MAX_AGE_MINUTES} минут"
+                await message.answer(error_text, reply_markup=get_main_keyboard())
+
+        await bot.delete_message(chat_id=message.chat.id, message_id=processing_msg.message_id)
+
+    except Exception as e:
+        logger.error(f"Ошибка обработки чека: {e}")
+        await message.answer("⚠️ Ошибка обработки чека. Попробуйте снова")
+
+@dp.message(Command("checkpayment"))
+async def cmd_check_payment(message: Message):
+    """Обработчик проверки платежа"""
+    user_id = message.from_user.id
+    tariff = await get_user_tariff(user_id)
+    if tariff is None:
+        await message.answer("❌ Сначала выберите тариф через меню", reply_markup=get_main_keyboard())
+        return
+
+    # Для бесплатного тарифа сразу выдаем код
+    if tariff == "2 минуты":
+        code, session_id = await generate_code(user_id, tariff)
+        await send_code_message(message, code, tariff)
+        return
+
+    # Для платных тарифов проверяем наличие подтвержденного чека
+    has_valid_receipt = await execute_db(
+        "SELECT 1 FROM receipt_transactions WHERE user_id = %s AND used_at > DATE_SUB(NOW(), INTERVAL 1 HOUR)",
+        (user_id,),
+        fetch_one=True
+    )
+
+    if not has_valid_receipt:
+        await message.answer("❌ Чек не найден или просрочен. Отправьте PDF-чек.")
+        return
+
+    code, session_id = await generate_code(user_id, tariff)
+    amount = PAYMENT_DETAILS["tariff_prices"][tariff]
+
+    if amount > 0:
+        await log_payment(user_id, amount, tariff)
+
+    await message.answer(
+        f"✅ Ваш код доступа: <code>{code}</code>\n"
+        f"Тариф: {tariff}\n"
+        f"Срок действия: {TARIFFS[tariff]} минут",
+        parse_mode="HTML",
+        reply_markup=get_main_keyboard()
+    )
+
+    await clear_user_tariff(user_id)
+    notify_website_bg(user_id, session_id)
+
+async def send_code_message(message: Message, code: str, tariff: str):
+    """Отправляет сообщение с кодом доступа"""
+    await message.answer(
+        f"✅ Ваш код доступа: <code>{code}</code>\n"
+        f"Тариф: {tariff}\n"
+        f"Срок действия: {TARIFFS[tariff]} минут",
+        parse_mode="HTML",
+        reply_markup=get_main_keyboard()
+    )
+
+@dp.message(F.text == "🕒 Мои сессии")
+async def handle_my_sessions(message: Message):
+    """Обработчик кнопки моих сессий"""
+    user_id = message.from_user.id
+    sessions = await execute_db(
+        """SELECT 
+            code, 
+            CASE 
+                WHEN expires_at > NOW() THEN 'active'
+                ELSE 'expired'
+            END as status,
+            expires_at,
+            duration_minutes
+        FROM codes 
+        WHERE user_id = %s 
+        ORDER BY expires_at DESC""",
+        (user_id,),
+        fetch_all=True
+    )
+
+    if not sessions:
+        await message.answer("У вас ещё нет сессий.", reply_markup=get_main_keyboard())
+        return
+
+    response = ["Ваши сессии:\n"]
+    for session in sessions:
+        emoji = "🟢" if session['status'] == 'active' else "🔴"
+        response.append(
+            f"{emoji} {session['duration_minutes']} мин. "
+            f"(до {session['expires_at'].strftime('%d.%m.%Y %H:%M')})"
+            f"{' - код: ' + session['code'] if session['status'] == 'active' else ''}"
+        )
+
+    await message.answer("\n".join(response), reply_markup=get_main_keyboard())
+
+@dp.message(Command("myid"))
+async def cmd_myid(message: Message):
+    """Показывает ID пользователя"""
+    await message.answer(f"Ваш chat_id: {message.from_user.id}", reply_markup=get_main_keyboard())
+
+# --- Админ-панель ---
+@dp.message(Command("admin"))
+async def cmd_admin(message: Message, state: FSMContext):
+    """Вход в админ-панель"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ У вас нет прав администратора")
+        return
+
+    await log_admin_action(message.from_user.id, "Вход в админ-панель")
+    await show_admin_menu(message)
+
+async def show_admin_menu(message: Message):
+    """Меню администратора"""
+    markup = ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text="📊 Статистика")],
+            [KeyboardButton(text="👥 Пользователи")],
+            [KeyboardButton(text="🔒 Блокировки")],
+            [KeyboardButton(text="💳 Реквизиты")],
+            [KeyboardButton(text="📋 Главное меню")]
+        ],
+        resize_keyboard=True
+    )
+
+    await message.answer("👨‍💻 Панель администратора\nВыберите раздел:", reply_markup=markup)
+
+@dp.message(F.text == "📊 Статистика")
+async def admin_stats(message: Message):
+    """Статистика бота"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    try:
+        stats = await execute_db(
+            "SELECT COUNT(*) as total_users, "
+            "SUM(CASE WHEN DATE(first_seen) = CURDATE() THEN 1 ELSE 0 END) as today_users "
+            "FROM user_stats",
+            fetch_one=True
+        )
+
+        payments = await execute_db(
+            "SELECT COUNT(*) as count, SUM(amount) as total FROM payments WHERE DATE(payment_date) = CURDATE()",
+            fetch_one=True
+        )
+
+        response = (
+            "📊 Статистика:\n"
+            f"👥 Всего пользователей: {stats['total_users']}\n"
+            f"🆕 Новых сегодня: {stats['today_users']}\n"
+            f"💳 Платежей сегодня: {payments['count']} на {payments['total'] or 0}₸"
+        )
+
+        await message.answer(response)
+
+    except Exception as e:
+        logger.error(f"Ошибка получения статистики: {e}")
+        await message.answer("⚠️ Ошибка получения статистики")
+
+@dp.message(F.text == "📋 Главное меню")
+async def admin_back_to_main(message: Message):
+    """Возврат из админ-панели в главное меню"""
+    await show_main_menu(message)
+
+@dp.message(F.text == "👥 Пользователи")
+async def admin_users(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    stats = await execute_db("SELECT COUNT(*) as total FROM user_stats", fetch_one=True)
+    await message.answer(f"Всего пользователей: {stats['total'] if stats else 0}")
+
+@dp.message(F.text == "🔒 Блокировки")
+async def admin_blocks(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    blocked = await execute_db("SELECT COUNT(DISTINCT user_id) as blocked FROM suspicious_receipts WHERE is_blocked = TRUE", fetch_one=True)
+    await message.answer(f"Заблокировано пользователей: {blocked['blocked'] if blocked else 0}")
+
+@dp.message(F.text == "💳 Реквизиты")
+async def admin_card_info(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    await message.answer(
+        f"Текущие реквизиты:\n"
+        f"Карта: {PAYMENT_DETAILS['card_number']}\n"
+        f"Получатель: {PAYMENT_DETAILS['card_name']}\n"
+        f"Имя для проверки: {PAYMENT_DETAILS['recipient_name']}"
+    )
+
+# --- Функции генерации кодов ---
+async def generate_code(user_id: int, tariff: str) -> tuple[str, str]:
+    """Генерирует код доступа"""
+    # Один вызов urandom на оба токена вместо двух
+    raw = os.urandom(12)
+    session_id = raw[:8].hex()
+    code = raw[8:].hex()
+    duration = TARIFFS[tariff]
+
+    await execute_write(
+        "INSERT INTO codes (code, user_id, session_id, duration_minutes, expires_at) "
+        "VALUES (%s, %s, %s, %s, DATE_ADD(NOW(), INTERVAL %s MINUTE))",
+        (code, user_id, session_id, duration, duration)
+    )
+
+    # У пользователя появился код — он больше не "новый"
+    _new_user_cache[user_id] = (False, time.monotonic())
+
+    return code, session_id
+
+# --- Основные настройки ---
+
+# --- Запуск бота ---
+async def main():
+    """Основная функция запуска"""
+    global HTTP_SESSION, _PDF_POOL
+    logger.info("Бот запускается...")
+
+    # Инициализируем пул подключений к БД
+    if await init_db() is None:
+        logger.error("Не удалось инициализировать подключение к БД")
+        return
+
+    # Одна сессия на весь процесс: переиспользуем TCP-соединения
+    # вместо нового handshake на каждое уведомление
+    HTTP_SESSION = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=2),
+        connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60)
+    )
+
+    _PDF_POOL = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count() or 2)
+
+    flusher = asyncio.create_task(_log_flusher())
+    runner = None
+
+    try:
+        if WEBHOOK_URL:
+            # Webhook-режим: Telegram пушит апдейты в наш aiohttp-сервер,
+            # без задержек и трафика цикла getUpdates
+            app = web.Application()
+            SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path=WEBHOOK_PATH)
+            setup_application(app, dp, bot=bot)
+
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, host=WEBAPP_HOST, port=WEBAPP_PORT).start()
+
+            await bot.set_webhook(f"{WEBHOOK_URL}{WEBHOOK_PATH}")
+            logger.info(f"Webhook установлен: {WEBHOOK_URL}{WEBHOOK_PATH}")
+            await asyncio.Event().wait()  # Работаем до остановки процесса
+        else:
+            await dp.start_polling(bot)
+    finally:
+        if runner:
+            await runner.cleanup()
+        flusher.cancel()
+        await _flush_log_queue()  # Дописываем то, что осталось в очереди
+        await HTTP_SESSION.close()
+        _PDF_POOL.shutdown(wait=False)
+        if pool:
+            pool.close()
+            await pool.wait_closed()
+
+if __name__ == '__main__':
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass  # uvloop опционален — без него работаем на стандартном цикле
     asyncio.run(main())
\ No newline at end of file
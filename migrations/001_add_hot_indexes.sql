@@ -0,0 +1,8 @@
+-- Индексы для горячих запросов бота.
+-- Без них проверки is_user_blocked / is_new_user и поиск чеков
+-- сканируют таблицы целиком по мере роста данных.
+
+CREATE INDEX idx_susp_user_blocked ON suspicious_receipts(user_id, is_blocked);
+CREATE INDEX idx_codes_user ON codes(user_id);
+CREATE UNIQUE INDEX idx_receipt_txid ON receipt_transactions(receipt_id);
+CREATE INDEX idx_receipt_user_used ON receipt_transactions(user_id, used_at);